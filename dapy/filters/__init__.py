@@ -3,6 +3,7 @@
 from dapy.filters.ensemble_kalman import (
     EnsembleKalmanFilter,
     EnsembleTransformKalmanFilter,
+    SerialEnsembleSquareRootFilter,
 )
 from dapy.filters.kalman import MatrixKalmanFilter, FunctionKalmanFilter
 from dapy.filters.particle import (
@@ -1,14 +1,76 @@
 """Ensemble Kalman filters for inference in state space models."""
 
-from typing import Tuple
+from typing import Dict, Tuple
 import numpy as np
 from numpy.random import Generator
-import numpy.linalg as nla
 import scipy.linalg as sla
-from dapy.models.base import AbstractGaussianObservationModel, AbstractModel
+from dapy.models.base import (
+    AbstractDiagonalGaussianObservationModel,
+    AbstractGaussianObservationModel,
+    AbstractModel,
+)
 from dapy.filters.base import AbstractEnsembleFilter
 
 
+def _gram_matrix(matrix: np.ndarray, block_size: int = 4096) -> np.ndarray:
+    """Compute `matrix @ matrix.T` via the symmetric rank-k BLAS routine `syrk`.
+
+    Only the lower triangle of the symmetric product is computed (and filled in
+    the returned array), halving the flops of a general matrix multiply; the
+    result is intended to be passed to routines such as `scipy.linalg.eigh` which
+    by default only read the lower triangle. The transposed-operand form of the
+    BLAS call is used so that no copy is required for a C-contiguous input.
+
+    For very wide inputs, as arise for models with very large observation
+    dimensions, the product is accumulated over column blocks of `block_size`
+    columns so that each panel of the operand remains cache resident across the
+    accumulation rather than both operand reads streaming the full array through
+    the cache hierarchy.
+    """
+    (syrk,) = sla.get_blas_funcs(("syrk",), (matrix,))
+    num_col = matrix.shape[1]
+    if num_col <= 8 * block_size:
+        return syrk(1.0, matrix.T, trans=1, lower=1)
+    gram = syrk(1.0, matrix[:, :block_size].T, trans=1, lower=1)
+    for start in range(block_size, num_col, block_size):
+        gram = syrk(
+            1.0,
+            matrix[:, start : start + block_size].T,
+            beta=1.0,
+            c=gram,
+            trans=1,
+            lower=1,
+            overwrite_c=True,
+        )
+    return gram
+
+
+def _mean_and_deviations(
+    particles: np.ndarray,
+    buffers: Dict[str, np.ndarray],
+    key: str,
+    dtype: np.dtype = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute ensemble mean and deviations, subtracting into a reusable buffer.
+
+    Writing the deviations with `np.subtract` into a preallocated buffer stored in
+    `buffers` under `key` avoids allocating a new `(num_particle, dim)` temporary
+    array for the broadcast subtraction on every assimilation update, with the
+    buffer lazily (re)allocated on the first call or if the ensemble shape changes.
+    If `dtype` is specified the deviations are computed in (and the buffer
+    allocated with) the given data type, with the mean always accumulated in the
+    precision of `particles`.
+    """
+    buffer = buffers.get(key)
+    if buffer is None or buffer.shape != particles.shape:
+        buffer = buffers[key] = np.empty(
+            particles.shape, particles.dtype if dtype is None else dtype
+        )
+    mean = particles.mean(0)
+    np.subtract(particles, mean, out=buffer)
+    return mean, buffer
+
+
 class EnsembleKalmanFilter(AbstractEnsembleFilter):
     """Ensemble Kalman filter with perturbed observations.
 
@@ -32,6 +94,20 @@ class EnsembleKalmanFilter(AbstractEnsembleFilter):
            filter technique, Monthly Weather Review, 126 (1998), pp. 796--811
     """
 
+    def __init__(self, assimilation_dtype: np.dtype = np.float64):
+        """
+        Args:
+            assimilation_dtype: NumPy data type to compute the ensemble deviations
+                and linear algebra of the assimilation update in. The default
+                double precision can be relaxed to `np.float32` to halve the
+                memory traffic of the update for large state and observation
+                dimensions, with the Monte Carlo error of the ensemble
+                approximation typically dominating single precision round-off;
+                the ensemble means are always accumulated in double precision.
+        """
+        self.assimilation_dtype = np.dtype(assimilation_dtype)
+        self._deviations_buffers = {}
+
     def _assimilation_update(
         self,
         model: AbstractModel,
@@ -43,13 +119,55 @@ class EnsembleKalmanFilter(AbstractEnsembleFilter):
         observation_particles = model.sample_observation_given_state(
             rng, state_particles, time_index
         )
-        state_deviations = state_particles - state_particles.mean(0)
-        observation_deviations = observation_particles - observation_particles.mean(0)
-        observation_errors = observation - observation_particles
+        _, state_deviations = _mean_and_deviations(
+            state_particles, self._deviations_buffers, "state", self.assimilation_dtype
+        )
+        _, observation_deviations = _mean_and_deviations(
+            observation_particles,
+            self._deviations_buffers,
+            "observation",
+            self.assimilation_dtype,
+        )
+        observation_errors = (observation - observation_particles).astype(
+            self.assimilation_dtype, copy=False
+        )
+        # The least-squares system defining the gain coefficients has rank at most
+        # num_particle - 1 whatever the observation dimension, so rather than
+        # factorizing the (potentially very tall) transposed deviation matrix the
+        # minimum-norm solution is computed from the normal equations in the
+        # ensemble subspace using the truncated pseudo-inverse of the
+        # num_particle x num_particle observation deviation Gram matrix, with the
+        # large dimension only entering through two thin matrix products
+        num_particle = state_particles.shape[0]
+        gram_eigenvalues, gram_eigenvectors = sla.eigh(
+            _gram_matrix(observation_deviations),
+            overwrite_a=True,
+            check_finite=False,
+            driver="evr",
+        )
+        # The deviation rows always sum to zero so the Gram matrix is always
+        # singular (rank at most num_particle - 1) and inverting the eigenvalues
+        # of its null space would amplify rounding noise into O(1) errors in the
+        # updated particles. Clip any small negative eigenvalues from rounding
+        # first, then truncate eigenvalues below an explicit relative cutoff,
+        # mirroring the rcond truncation of a pseudo-inverse - relying on a
+        # solver's default rounding-level truncation is not reliable here as the
+        # null eigenvalues can straddle it
+        np.maximum(gram_eigenvalues, 0, out=gram_eigenvalues)
+        eigenvalue_cutoff = (
+            gram_eigenvalues[-1] * num_particle * np.finfo(gram_eigenvalues.dtype).eps
+        )
+        non_zero_eigenvalues = gram_eigenvalues > eigenvalue_cutoff
+        inv_gram_eigenvalues = np.zeros_like(gram_eigenvalues)
+        inv_gram_eigenvalues[non_zero_eigenvalues] = (
+            1 / gram_eigenvalues[non_zero_eigenvalues]
+        )
+        least_squares_coefficients = gram_eigenvectors @ (
+            (gram_eigenvectors.T @ (observation_deviations @ observation_errors.T))
+            * inv_gram_eigenvalues[:, None]
+        )
         state_particles = (
-            state_particles
-            + nla.lstsq(observation_deviations.T, observation_errors.T, rcond=None)[0].T
-            @ state_deviations
+            state_particles + least_squares_coefficients.T @ state_deviations
         )
         return state_particles, state_particles.mean(0), state_particles.std(0)
 
@@ -76,6 +194,20 @@ class EnsembleTransformKalmanFilter(AbstractEnsembleFilter):
            Monthly Weather Review, 131 (2003), pp. 1485--1490.
     """
 
+    def __init__(self, assimilation_dtype: np.dtype = np.float64):
+        """
+        Args:
+            assimilation_dtype: NumPy data type to compute the ensemble deviations
+                and linear algebra of the assimilation update in. The default
+                double precision can be relaxed to `np.float32` to halve the
+                memory traffic of the update for large state and observation
+                dimensions, with the Monte Carlo error of the ensemble
+                approximation typically dominating single precision round-off;
+                the ensemble means are always accumulated in double precision.
+        """
+        self.assimilation_dtype = np.dtype(assimilation_dtype)
+        self._deviations_buffers = {}
+
     def _assimilation_update(
         self,
         model: AbstractGaussianObservationModel,
@@ -85,14 +217,19 @@ class EnsembleTransformKalmanFilter(AbstractEnsembleFilter):
         time_index: int,
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         num_particle = state_particles.shape[0]
-        state_mean = state_particles.mean(0)
-        state_deviations = state_particles - state_mean
+        state_mean, state_deviations = _mean_and_deviations(
+            state_particles, self._deviations_buffers, "state", self.assimilation_dtype
+        )
         # Note: compared to the `observation_particles` variable defined in the
         # perturbed observations EnKF implementation here these observation 'particles'
         # are pre addition of observation noise
         observation_particles = model.observation_mean(state_particles, time_index)
-        observation_mean = observation_particles.mean(0)
-        observation_deviations = observation_particles - observation_mean
+        observation_mean, observation_deviations = _mean_and_deviations(
+            observation_particles,
+            self._deviations_buffers,
+            "observation",
+            self.assimilation_dtype,
+        )
         observation_error = observation - observation_mean
         # Let X = state_deviations, Y = observation_deviations, N = num_particle,
         # R = observation_noise_covar, Z = post_state_deviations, I = identity(N)
@@ -102,54 +239,175 @@ class EnsembleTransformKalmanFilter(AbstractEnsembleFilter):
         # T @ T = inv(I +  Y @ inv(R) @ Y.T / (N - 1))) then Z = T @ X.
         # Defining M = Y @ inv(chol(R / (N - 1)).T) then
         # I + M @ M.T = I + Y @ inv(R) @ Y.T / (N - 1)) and T @ T = inv(I + M @ M.T).
-        # If U, s, V_T = svd(M) such that M = U @ diag(s) @ V_T then
-        # I + M @ M.T = U @ U.T + U @ diag(s**2) @ U.T = U @ diag(1 + s**2) @ U.T
-        # and so T = U @ diag(1 / (1 + s**2)**0.5) @ U.T
-        transform_matrix_eigenvectors, non_zero_singular_values, _ = nla.svd(
+        # As M @ M.T is a N x N positive semi-definite matrix it has an
+        # eigendecomposition M @ M.T = U @ diag(v) @ U.T with U orthogonal and v
+        # non-negative such that
+        # I + M @ M.T = U @ diag(1 + v) @ U.T
+        # and so T = U @ diag(1 / (1 + v)**0.5) @ U.T.
+        # Computing the decomposition by an eigh on the N x N Gram matrix M @ M.T
+        # rather than an SVD of the N x dim_observation matrix M avoids computing
+        # dim_observation-dimensional singular vectors which are not required, with
+        # the rank-deficiency of M when dim_observation < N automatically handled
+        # by the corresponding eigenvalues being zero.
+        # Cast back to the assimilation data type as the whitening by the (double
+        # precision) observation noise covariance factor may have promoted the
+        # deviations to double precision
+        whitened_observation_deviations = (
             model.postmultiply_by_inv_chol_trans_observation_noise_covar(
                 observation_deviations
             )
-            / (num_particle - 1) ** 0.5,
-        )
-        squared_transform_matrix_eigenvalues = 1 / (1 + non_zero_singular_values ** 2)
-        if model.dim_observation < num_particle:
-            squared_transform_matrix_eigenvalues = np.concatenate(
-                [
-                    squared_transform_matrix_eigenvalues,
-                    np.ones(num_particle - model.dim_observation),
-                ]
-            )
-        transform_matrix = (
-            transform_matrix_eigenvectors * squared_transform_matrix_eigenvalues ** 0.5
-        ) @ transform_matrix_eigenvectors.T
+            / (num_particle - 1) ** 0.5
+        ).astype(self.assimilation_dtype, copy=False)
+        # A triangular (Cholesky or QR based) square-root factor of the inverse
+        # would be cheaper to compute here but would not preserve the zero-mean
+        # property of the ensemble deviations - the transform needs to be a
+        # symmetric function of the Gram matrix - so an eigendecomposition is used,
+        # operating in-place on the Gram matrix which is a scratch temporary.
+        # The driver argument pins the MRRR eigensolver, which is currently also
+        # scipy's default for standard problems, so the solver choice here does
+        # not silently track upstream default changes
+        gram_eigenvalues, transform_matrix_eigenvectors = sla.eigh(
+            _gram_matrix(whitened_observation_deviations),
+            overwrite_a=True,
+            check_finite=False,
+            driver="evr",
+        )
+        # Clip any small negative eigenvalues arising from rounding in-place: the
+        # bound is one-sided so np.maximum avoids the second pass and temporary
+        # allocation of np.clip
+        np.maximum(gram_eigenvalues, 0, out=gram_eigenvalues)
+        squared_transform_matrix_eigenvalues = 1 / (1 + gram_eigenvalues)
         # Let e = observation_error, x = state_mean, z = post_state_mean and
         # X, Y, R, N, I as above
         # For consistency with the Kalman filter mean update we require that
         # z = x + X.T @ inv(I + Y @ inv(R) @ Y.T / (N - 1)) @ Y.T @ inv(R) @ e / (N - 1)
-        # Reusing U and s from above we have that
-        # inv(I + Y @ inv(R) @ Y.T / (N - 1)) = diag(1 / (1 + s**2)) @ U.T
+        # Reusing U and v from above we have that
+        # inv(I + Y @ inv(R) @ Y.T / (N - 1)) = U @ diag(1 / (1 + v)) @ U.T
         # and so
-        # z = x + X.T @ U @ diag(1 / (1 + s**2)) @ U.T @ Y @ inv(R) @ e / (N - 1)
-        kalman_gain_mult_observation_error = state_deviations.T @ (
-            transform_matrix_eigenvectors
+        # z = x + X.T @ U @ diag(1 / (1 + v)) @ U.T @ Y @ inv(R) @ e / (N - 1)
+        # The product U.T @ X appears in both the mean update above and the
+        # deviation update Z = T @ X = U @ diag(1 / (1 + v)**0.5) @ U.T @ X so it is
+        # computed once and shared, which also avoids materializing the dense N x N
+        # transform matrix T and associating the matrix chains such that only
+        # matrix-vector and N x {N, dim_state} matrix products remain.
+        eigenvectors_t_state_deviations = (
+            transform_matrix_eigenvectors.T @ state_deviations
+        )
+        kalman_gain_coefficients = (
+            transform_matrix_eigenvectors.T
             @ (
-                (
-                    transform_matrix_eigenvectors.T
-                    @ (
-                        observation_deviations
-                        @ model.postmultiply_by_inv_observation_noise_covar(
-                            observation_error
-                        )
-                    )
-                )
-                * squared_transform_matrix_eigenvalues
+                observation_deviations
+                @ model.postmultiply_by_inv_observation_noise_covar(observation_error)
             )
-            / (num_particle - 1)
+        ) * squared_transform_matrix_eigenvalues
+        post_state_mean = state_mean + (
+            kalman_gain_coefficients @ eigenvectors_t_state_deviations
+        ) / (num_particle - 1)
+        post_state_deviations = transform_matrix_eigenvectors @ (
+            squared_transform_matrix_eigenvalues[:, None] ** 0.5
+            * eigenvectors_t_state_deviations
+        )
+        # Compute per-dimension ensemble standard deviations as a single einsum
+        # contraction over the (zero-mean) deviations rather than materializing a
+        # squared deviations temporary and reducing it in a second pass
+        post_state_std = np.sqrt(
+            np.einsum("ij,ij->j", post_state_deviations, post_state_deviations)
+            / num_particle
         )
-        post_state_mean = state_mean + kalman_gain_mult_observation_error
-        post_state_deviations = transform_matrix @ state_deviations
         return (
             post_state_mean + post_state_deviations,
             post_state_mean,
-            (post_state_deviations ** 2).mean(0) ** 0.5,
+            post_state_std,
+        )
+
+
+class SerialEnsembleSquareRootFilter(AbstractEnsembleFilter):
+    """Ensemble square-root filter assimilating observations serially.
+
+    Requires that the model has Gaussian observation noise with diagonal
+    covariance, in which case the observations at a time index are conditionally
+    independent given the state and may be assimilated one scalar observation at a
+    time. Each scalar observation is absorbed by a rank-one square-root update to
+    the ensemble deviations together with a corresponding update to the ensemble
+    mean, replacing the matrix factorizations of the joint assimilation update
+    with a sequence of scalar divides at a cost linear in the observation
+    dimension [1]. The predicted observation ensemble is updated alongside the
+    state ensemble after each scalar assimilation so that later observations see
+    the effect of earlier ones.
+
+    References:
+
+        1. J. S. Whitaker and T. M. Hamill, Ensemble data assimilation without
+           perturbed observations, Monthly Weather Review, 130 (2002),
+           pp. 1913--1924.
+    """
+
+    def _assimilation_update(
+        self,
+        model: AbstractDiagonalGaussianObservationModel,
+        rng: Generator,
+        state_particles: np.ndarray,
+        observation: np.ndarray,
+        time_index: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        num_particle = state_particles.shape[0]
+        state_mean = state_particles.mean(0)
+        state_deviations = state_particles - state_mean
+        observation_particles = model.observation_mean(state_particles, time_index)
+        predicted_observation_mean = observation_particles.mean(0)
+        predicted_observation_deviations = (
+            observation_particles - predicted_observation_mean
+        )
+        observation_noise_variance = model.observation_noise_std ** 2
+        for observation_index in range(model.dim_observation):
+            predicted_deviations_i = predicted_observation_deviations[
+                :, observation_index
+            ]
+            predicted_variance_i = (
+                predicted_deviations_i @ predicted_deviations_i / (num_particle - 1)
+            )
+            innovation_variance_i = (
+                predicted_variance_i + observation_noise_variance[observation_index]
+            )
+            # Kalman gains for the state and predicted observation ensembles for
+            # the single scalar observation being assimilated
+            state_gain = (predicted_deviations_i @ state_deviations) / (
+                (num_particle - 1) * innovation_variance_i
+            )
+            observation_gain = (
+                predicted_deviations_i @ predicted_observation_deviations
+            ) / ((num_particle - 1) * innovation_variance_i)
+            observation_error_i = (
+                observation[observation_index]
+                - predicted_observation_mean[observation_index]
+            )
+            state_mean = state_mean + state_gain * observation_error_i
+            predicted_observation_mean = (
+                predicted_observation_mean + observation_gain * observation_error_i
+            )
+            # Rank-one square-root update to the deviations using the scaled gain
+            # of [1] such that the analysis deviations have covariance consistent
+            # with the Kalman filter covariance update for the scalar observation
+            gain_scale = 1 / (
+                1
+                + (
+                    observation_noise_variance[observation_index]
+                    / innovation_variance_i
+                )
+                ** 0.5
+            )
+            state_deviations = state_deviations - gain_scale * np.outer(
+                predicted_deviations_i, state_gain
+            )
+            predicted_observation_deviations = (
+                predicted_observation_deviations
+                - gain_scale * np.outer(predicted_deviations_i, observation_gain)
+            )
+        return (
+            state_mean + state_deviations,
+            state_mean,
+            np.sqrt(
+                np.einsum("ij,ij->j", state_deviations, state_deviations)
+                / num_particle
+            ),
         )
@@ -4,7 +4,6 @@ import abc
 from typing import Optional, Sequence, Tuple, Dict
 import numpy as np
 from numpy.random import Generator
-import numpy.linalg as nla
 import scipy.linalg as sla
 from dapy.models.base import AbstractLinearGaussianModel
 from dapy.utils.progressbar import ProgressBar
@@ -112,7 +111,8 @@ class AbstractKalmanFilter(abc.ABC):
                             sqrt_state_covar = sla.cholesky(state_covar, lower=True)
                         except sla.LinAlgError:
                             eigval, eigvec = sla.eigh(state_covar)
-                            sqrt_state_covar = eigvec * np.clip(eigval, 0, None) ** 0.5
+                            np.maximum(eigval, 0, out=eigval)
+                            sqrt_state_covar = eigvec * eigval ** 0.5
                         state_samples_sequence[t] = (
                             state_mean[None, :]
                             + rng.standard_normal((num_sample, model.dim_state))
@@ -257,14 +257,22 @@ class MatrixKalmanFilter(AbstractKalmanFilter):
             model.observation_matrix @ state_covar @ model.observation_matrix.T
         )
         observation_matrix_state_covar = model.observation_matrix @ state_covar
-        kalman_gain = nla.solve(observation_covar, observation_matrix_state_covar).T
+        # Observation covariance is symmetric positive-definite so solve via a
+        # Cholesky factorization rather than a general LU decomposition
+        kalman_gain = sla.cho_solve(
+            sla.cho_factor(observation_covar, lower=True, check_finite=False),
+            observation_matrix_state_covar,
+            check_finite=False,
+        ).T
         state_mean = state_mean + kalman_gain @ (observation - observation_mean)
         if self.use_joseph_form:
             # use more numerically stable but more expensive Joseph's form
-            # for covariance update
-            covar_transform = (
-                np.identity(model.dim_state) - kalman_gain @ model.observation_matrix
-            )
+            # for covariance update, forming identity - kalman_gain @
+            # observation_matrix by negating the product in place and adding one
+            # to its diagonal rather than materializing a dense identity matrix
+            covar_transform = kalman_gain @ model.observation_matrix
+            np.negative(covar_transform, out=covar_transform)
+            covar_transform[np.diag_indices_from(covar_transform)] += 1
             state_covar = (
                 covar_transform @ state_covar @ covar_transform.T
                 + model.postmultiply_by_observation_noise_covar(kalman_gain)
@@ -316,7 +324,13 @@ class FunctionKalmanFilter(AbstractKalmanFilter):
         observation_matrix_state_covar = model.observation_mean(
             state_covar, time_index
         ).T
-        kalman_gain = nla.solve(observation_covar, observation_matrix_state_covar).T
+        # Observation covariance is symmetric positive-definite so solve via a
+        # Cholesky factorization rather than a general LU decomposition
+        kalman_gain = sla.cho_solve(
+            sla.cho_factor(observation_covar, lower=True, check_finite=False),
+            observation_matrix_state_covar,
+            check_finite=False,
+        ).T
         state_mean = state_mean + kalman_gain @ (observation - observation_mean)
         state_covar = state_covar - kalman_gain @ observation_matrix_state_covar
         # Symmetrize covariance to improve numerical stability
@@ -3,9 +3,10 @@ import abc
 """Localised ensemble filters for inference in spatially extended state-space models."""
 
 from typing import Tuple, Dict, Callable, Any, Optional, Sequence
-from functools import partial
+from functools import lru_cache, partial
 import numpy as np
 import numpy.linalg as nla
+import numba as nb
 from numpy.random import Generator
 from scipy.special import logsumexp
 from dapy.filters.base import AbstractEnsembleFilter
@@ -15,6 +16,13 @@ from dapy.utils.localisation import gaspari_and_cohn_weighting
 from dapy.utils.pou import AbstractPartitionOfUnity, PerMeshNodePartitionOfUnityBasis
 from dapy.ot.costs import calculate_cost_matrices_1d, calculate_cost_matrices_2d
 
+try:
+    import cupy
+
+    CUPY_AVAILABLE = True
+except ImportError:
+    CUPY_AVAILABLE = False
+
 
 class AbstractLocalEnsembleFilter(AbstractEnsembleFilter):
     """Localised ensemble filter base class for spatially extended state-space models.
@@ -298,6 +306,262 @@ class LocalEnsembleTransformParticleFilter(AbstractLocalEnsembleFilter):
             return node_post_state_particles
 
 
+def _batched_local_assimilation_updates(
+    xp,
+    state_particles_mesh,
+    observation_means,
+    observation,
+    observation_noise_std,
+    padded_indices,
+    padded_weights,
+    inflation_factor,
+):
+    """Batched local ensemble transform Kalman updates on stacked padded arrays.
+
+    Performs the per mesh node assimilation updates of the local ensemble
+    transform Kalman filter for all spatial mesh nodes using batched linear
+    algebra operations on stacked per-node arrays, zero-padded along the local
+    observation axis to a common size. The implementation is generic over the
+    array module `xp`, which may be either NumPy or CuPy, so that the same code
+    path serves both the CPU batched and GPU backends.
+
+    Args:
+        xp: Array module implementing the NumPy interface (`numpy` or `cupy`).
+        state_particles_mesh: Three-dimensional array of shape
+            `(num_particle, dim_per_node_state, mesh_size)` of meshed state
+            particles to perform assimilation updates to.
+        observation_means: Two-dimensional array of shape
+            `(num_particle, dim_observation)` with each row the predicted
+            observation means for a particle in the ensemble.
+        observation: One-dimensional array of shape `(dim_observation,)` with the
+            values of the observations at the current time index.
+        observation_noise_std: One-dimensional array of shape `(dim_observation,)`
+            of the standard deviations of each observed variable given the current
+            state variable values.
+        padded_indices: Two-dimensional integer array of shape
+            `(mesh_size, max_num_local_observation)` of the per mesh node local
+            observation indices, padded with zeros.
+        padded_weights: Two-dimensional array of shape
+            `(mesh_size, max_num_local_observation)` of the per mesh node
+            localisation weights, padded with zeros so that padding entries make
+            no contribution to the updates.
+        inflation_factor: A value greater than or equal to one used to inflate the
+            posterior ensemble deviations on each update.
+
+    Returns:
+        Three-dimensional array of same shape as `state_particles_mesh` of the
+        updated state particles.
+    """
+    num_particle = state_particles_mesh.shape[0]
+    # Gather stacked per-node local observation quantities, with shapes
+    # (mesh_size, num_particle, max_num_local_observation) for the deviations
+    # and (mesh_size, max_num_local_observation) for the per-observation terms
+    local_observation_particles = observation_means[:, padded_indices].transpose(
+        (1, 0, 2)
+    )
+    local_observation_means = local_observation_particles.mean(1)
+    local_observation_deviations = (
+        local_observation_particles - local_observation_means[:, None, :]
+    )
+    local_observation_errors = observation[padded_indices] - local_observation_means
+    effective_inv_observation_variance = (
+        padded_weights / observation_noise_std[padded_indices] ** 2
+    )
+    whitened_observation_deviations = (
+        local_observation_deviations
+        * effective_inv_observation_variance[:, None, :] ** 0.5
+        / (num_particle - 1) ** 0.5
+    )
+    # Batched num_particle x num_particle Gram matrix eigendecompositions over
+    # all mesh nodes in a single stacked call
+    gram_eigenvalues, transform_matrix_eigenvectors = xp.linalg.eigh(
+        whitened_observation_deviations
+        @ whitened_observation_deviations.transpose((0, 2, 1))
+    )
+    # Clip any small negative eigenvalues arising from rounding in-place with the
+    # one-sided xp.maximum rather than allocating a clipped temporary
+    xp.maximum(gram_eigenvalues, 0, out=gram_eigenvalues)
+    squared_transform_matrix_eigenvalues = 1 / (1 + gram_eigenvalues)
+    node_state_particles = state_particles_mesh.transpose((2, 0, 1))
+    node_state_means = node_state_particles.mean(1)
+    node_state_deviations = node_state_particles - node_state_means[:, None, :]
+    eigenvectors_t_state_deviations = (
+        transform_matrix_eigenvectors.transpose((0, 2, 1)) @ node_state_deviations
+    )
+    kalman_gain_coefficients = (
+        xp.einsum(
+            "kpq,kp->kq",
+            transform_matrix_eigenvectors,
+            xp.einsum(
+                "kpo,ko->kp",
+                local_observation_deviations,
+                local_observation_errors * effective_inv_observation_variance,
+            ),
+        )
+        * squared_transform_matrix_eigenvalues
+    )
+    kalman_gain_mult_observation_errors = (
+        xp.einsum(
+            "kq,kqd->kd", kalman_gain_coefficients, eigenvectors_t_state_deviations
+        )
+        / (num_particle - 1)
+    )
+    node_post_state_deviations = transform_matrix_eigenvectors @ (
+        squared_transform_matrix_eigenvalues[:, :, None] ** 0.5
+        * eigenvectors_t_state_deviations
+    )
+    return (
+        node_state_means[:, None, :]
+        + kalman_gain_mult_observation_errors[:, None, :]
+        + inflation_factor * node_post_state_deviations
+    ).transpose((1, 2, 0))
+
+
+@lru_cache(maxsize=None)
+def _make_letkf_local_assimilation_updates(num_particle):
+    """Construct JIT compiled local ensemble transform Kalman update kernel.
+
+    Returns a kernel performing the per mesh node assimilation updates of the
+    local ensemble transform Kalman filter for all spatial mesh nodes in a single
+    call, parallelizing over the (independent) mesh node updates, which avoids
+    the Python interpreter overhead of invoking the local update separately for
+    each of the typically large number of mesh nodes.
+
+    The kernel is specialized to a fixed ensemble size by closing over
+    `num_particle` so that it enters the compiled code as a constant, allowing
+    the loops over ensemble members to be unrolled and vectorized for the
+    specific (typically small) ensemble size in use. The constructed kernels are
+    memoized so that each ensemble size is only compiled once per process.
+
+    Args:
+        num_particle: Number of particles in the ensemble the kernel will be
+            applied to, equal to the size of the first axis of the meshed state
+            particle arrays passed to the kernel.
+
+    Returns:
+        JIT compiled kernel with signature
+
+            _letkf_local_assimilation_updates(
+                state_particles_mesh, observation_means, observation,
+                observation_noise_std, node_observation_indices,
+                node_observation_weights, node_observation_offsets,
+                inflation_factor, post_state_particles_mesh)
+
+        where `state_particles_mesh` is a three-dimensional array of shape
+        `(num_particle, dim_per_node_state, mesh_size)` of meshed state particles
+        to perform assimilation updates to, `observation_means` a two-dimensional
+        array of shape `(num_particle, dim_observation)` with each row the
+        predicted observation means for a particle in the ensemble, `observation`
+        a one-dimensional array of shape `(dim_observation,)` of the values of
+        the observations at the current time index, `observation_noise_std` a
+        one-dimensional array of shape `(dim_observation,)` of the standard
+        deviations of each observed variable given the current state variable
+        values, `node_observation_indices` and `node_observation_weights`
+        one-dimensional arrays of respectively the concatenated per mesh node
+        local observation indices and localisation weights, with the entries for
+        node `i` in the slice `offsets[i]:offsets[i + 1]` where
+        `offsets = node_observation_offsets` is a one-dimensional integer array
+        of shape `(mesh_size + 1,)`, `inflation_factor` a value greater than or
+        equal to one used to inflate the posterior ensemble deviations on each
+        update and `post_state_particles_mesh` a three-dimensional array of same
+        shape as `state_particles_mesh` to write the updated state particles to.
+    """
+
+    @nb.njit(parallel=True)
+    def _letkf_local_assimilation_updates(
+        state_particles_mesh,
+        observation_means,
+        observation,
+        observation_noise_std,
+        node_observation_indices,
+        node_observation_weights,
+        node_observation_offsets,
+        inflation_factor,
+        post_state_particles_mesh,
+    ):
+        dim_per_node_state = state_particles_mesh.shape[1]
+        mesh_size = state_particles_mesh.shape[2]
+        for node_index in nb.prange(mesh_size):
+            offset = node_observation_offsets[node_index]
+            num_local_observation = node_observation_offsets[node_index + 1] - offset
+            node_state_particles = np.ascontiguousarray(
+                state_particles_mesh[:, :, node_index]
+            )
+            # Gather local observation deviations, errors and effective inverse
+            # variances for this node from the flattened index and weight arrays
+            local_observation_deviations = np.empty(
+                (num_particle, num_local_observation)
+            )
+            local_observation_error = np.empty(num_local_observation)
+            effective_inv_observation_variance = np.empty(num_local_observation)
+            for j in range(num_local_observation):
+                observation_index = node_observation_indices[offset + j]
+                local_observation_mean_j = 0.0
+                for p in range(num_particle):
+                    local_observation_deviations[p, j] = observation_means[
+                        p, observation_index
+                    ]
+                    local_observation_mean_j += local_observation_deviations[p, j]
+                local_observation_mean_j /= num_particle
+                for p in range(num_particle):
+                    local_observation_deviations[p, j] -= local_observation_mean_j
+                local_observation_error[j] = (
+                    observation[observation_index] - local_observation_mean_j
+                )
+                effective_inv_observation_variance[j] = (
+                    node_observation_weights[offset + j]
+                    / observation_noise_std[observation_index] ** 2
+                )
+            node_state_mean = np.zeros(dim_per_node_state)
+            for p in range(num_particle):
+                for k in range(dim_per_node_state):
+                    node_state_mean[k] += node_state_particles[p, k]
+            node_state_mean /= num_particle
+            node_state_deviations = node_state_particles - node_state_mean
+            whitened_observation_deviations = (
+                local_observation_deviations
+                * np.sqrt(effective_inv_observation_variance)
+                / np.sqrt(num_particle - 1.0)
+            )
+            gram_eigenvalues, transform_matrix_eigenvectors = np.linalg.eigh(
+                whitened_observation_deviations
+                @ np.ascontiguousarray(whitened_observation_deviations.T)
+            )
+            transform_matrix_eigenvectors = np.ascontiguousarray(
+                transform_matrix_eigenvectors
+            )
+            eigenvectors_transposed = np.ascontiguousarray(
+                transform_matrix_eigenvectors.T
+            )
+            squared_transform_matrix_eigenvalues = 1.0 / (
+                1.0 + np.maximum(gram_eigenvalues, 0.0)
+            )
+            transform_matrix = (
+                transform_matrix_eigenvectors
+                * np.sqrt(squared_transform_matrix_eigenvalues)
+            ) @ eigenvectors_transposed
+            gain_coefficients = (
+                eigenvectors_transposed
+                @ (
+                    local_observation_deviations
+                    @ (local_observation_error * effective_inv_observation_variance)
+                )
+            ) * squared_transform_matrix_eigenvalues
+            kalman_gain_mult_observation_error = (
+                (gain_coefficients @ eigenvectors_transposed) @ node_state_deviations
+            ) / (num_particle - 1)
+            node_post_state_deviations = transform_matrix @ node_state_deviations
+            for p in range(num_particle):
+                for k in range(dim_per_node_state):
+                    post_state_particles_mesh[p, k, node_index] = (
+                        node_state_mean[k]
+                        + kalman_gain_mult_observation_error[k]
+                        + inflation_factor * node_post_state_deviations[p, k]
+                    )
+
+    return _letkf_local_assimilation_updates
+
+
 class LocalEnsembleTransformKalmanFilter(AbstractLocalEnsembleFilter):
     """Localised ensemble transform Kalman filter for spatially extended models.
 
@@ -308,6 +572,253 @@ class LocalEnsembleTransformKalmanFilter(AbstractLocalEnsembleFilter):
            Physica D: Nonlinear Phenomena, 230(1), 112-126.
     """
 
+    def __init__(
+        self,
+        localisation_radius: float,
+        localisation_weighting_func: Callable[
+            [np.ndarray, float], np.ndarray
+        ] = gaspari_and_cohn_weighting,
+        inflation_factor: float = 1.0,
+        local_update_backend: str = "jit",
+    ):
+        """
+        Args:
+            localisation_radius: Positive value specifing maximum distance from a mesh
+                node to observation point to assign a non-zero localisation weight to
+                the observation point for that mesh node. Observation points within a
+                distance of the localisation radius of the mesh node will be assigned
+                localisation weights in the range `[0, 1]`.
+            localisation_weighting_func: Function which given a one-dimensional array of
+                distances and positive localisation radius computes a set of
+                localisation weights in the range `[0, 1]` with distances greater than
+                the localisation radius mapping to zero weights and distances between
+                zero and the localisation radius mapping monotonically from weight one
+                at distance zero to weight zero at distance equal to the localisation
+                radius.
+            inflation_factor: A value greater than or equal to one used to inflate the
+                posterior ensemble deviations on each update as a heuristic to overcome
+                the underestimation of the uncertainty in the system state by ensemble
+                methods.
+            local_update_backend: Which implementation to use to perform the per mesh
+                node local assimilation updates. One of "jit" (default, all node
+                updates performed by a single JIT compiled kernel parallelized over
+                mesh nodes), "batched" (node updates performed by batched NumPy linear
+                algebra operations on stacked per-node arrays zero-padded to a common
+                local observation dimension), "gpu" (as for "batched" but with the
+                stacked array operations performed on a GPU using CuPy, which must
+                be installed) or "loop" (node updates performed in a Python loop
+                over mesh nodes, provided mainly as a reference implementation).
+        """
+        if local_update_backend not in ("jit", "batched", "gpu", "loop"):
+            raise ValueError(
+                f"Unknown local_update_backend value {local_update_backend}, "
+                f"expected one of 'jit', 'batched', 'gpu' or 'loop'"
+            )
+        if local_update_backend == "gpu" and not CUPY_AVAILABLE:
+            raise ValueError(
+                "local_update_backend='gpu' requires CuPy to be installed"
+            )
+        super().__init__(
+            localisation_radius=localisation_radius,
+            localisation_weighting_func=localisation_weighting_func,
+            inflation_factor=inflation_factor,
+        )
+        self.local_update_backend = local_update_backend
+
+    def _perform_model_specific_initialization(
+        self, model: AbstractDiagonalGaussianObservationModel, num_particle: int,
+    ):
+        super()._perform_model_specific_initialization(model, num_particle)
+        self._flat_observation_indices_and_weights_cache = None
+        self._padded_observation_indices_and_weights_cache = None
+
+    def _flat_observation_indices_and_weights(
+        self, model: AbstractDiagonalGaussianObservationModel
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Concatenated local observation indices and weights for all mesh nodes.
+
+        Returns flattened arrays of the per mesh node local observation indices and
+        localisation weights plus an array of offsets such that the entries for
+        node `i` are stored in the slice `offsets[i]:offsets[i + 1]`, in the format
+        required by the JIT compiled local assimilation update kernel.
+        """
+        if self._flat_observation_indices_and_weights_cache is not None:
+            return self._flat_observation_indices_and_weights_cache
+        indices_arrays = []
+        weights_arrays = []
+        offsets = np.zeros(model.mesh_size + 1, dtype=np.int64)
+        for node_index in range(model.mesh_size):
+            indices, weights = self._observation_indices_and_weights(
+                node_index, model
+            )
+            indices_arrays.append(np.asarray(indices, dtype=np.int64))
+            weights_arrays.append(weights)
+            offsets[node_index + 1] = offsets[node_index] + len(indices)
+        self._flat_observation_indices_and_weights_cache = (
+            np.concatenate(indices_arrays),
+            np.concatenate(weights_arrays),
+            offsets,
+        )
+        return self._flat_observation_indices_and_weights_cache
+
+    def _padded_observation_indices_and_weights(
+        self, model: AbstractDiagonalGaussianObservationModel
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Per mesh node local observation indices and weights padded to fixed size.
+
+        Returns two-dimensional arrays of the per mesh node local observation
+        indices and localisation weights, padded along the last axis to the maximal
+        local observation dimension over all nodes, in the format required by the
+        batched local assimilation update implementation. Padding entries are
+        assigned index zero and weight zero so that they make no contribution to
+        the local updates while keeping all index gathers in bounds.
+        """
+        if self._padded_observation_indices_and_weights_cache is not None:
+            return self._padded_observation_indices_and_weights_cache
+        indices_and_weights = [
+            self._observation_indices_and_weights(node_index, model)
+            for node_index in range(model.mesh_size)
+        ]
+        max_num_local_observation = max(
+            max(len(indices) for indices, _ in indices_and_weights), 1
+        )
+        padded_indices = np.zeros(
+            (model.mesh_size, max_num_local_observation), dtype=np.int64
+        )
+        padded_weights = np.zeros((model.mesh_size, max_num_local_observation))
+        for node_index, (indices, weights) in enumerate(indices_and_weights):
+            padded_indices[node_index, : len(indices)] = indices
+            padded_weights[node_index, : len(indices)] = weights
+        self._padded_observation_indices_and_weights_cache = (
+            padded_indices,
+            padded_weights,
+        )
+        return self._padded_observation_indices_and_weights_cache
+
+    def _batched_assimilation_update(
+        self,
+        model: AbstractDiagonalGaussianObservationModel,
+        state_particles: np.ndarray,
+        observation: np.ndarray,
+        time_index: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        num_particle = state_particles.shape[0]
+        state_particles_mesh = state_particles.reshape(
+            (num_particle, -1, model.mesh_size)
+        )
+        observation_means = model.observation_mean(state_particles, time_index)
+        padded_indices, padded_weights = self._padded_observation_indices_and_weights(
+            model
+        )
+        post_state_particles_mesh = _batched_local_assimilation_updates(
+            np,
+            state_particles_mesh,
+            observation_means,
+            observation,
+            model.observation_noise_std,
+            padded_indices,
+            padded_weights,
+            self.inflation_factor,
+        )
+        post_state_particles = post_state_particles_mesh.reshape((num_particle, -1))
+        return (
+            post_state_particles,
+            post_state_particles.mean(0),
+            post_state_particles.std(0),
+        )
+
+    def _gpu_assimilation_update(
+        self,
+        model: AbstractDiagonalGaussianObservationModel,
+        state_particles: np.ndarray,
+        observation: np.ndarray,
+        time_index: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        num_particle = state_particles.shape[0]
+        state_particles_mesh = state_particles.reshape(
+            (num_particle, -1, model.mesh_size)
+        )
+        observation_means = model.observation_mean(state_particles, time_index)
+        padded_indices, padded_weights = self._padded_observation_indices_and_weights(
+            model
+        )
+        # Transfer per time step arrays to device once, perform all per-node
+        # updates there with the batched implementation and transfer the updated
+        # particles back to host
+        post_state_particles_mesh = cupy.asnumpy(
+            _batched_local_assimilation_updates(
+                cupy,
+                cupy.asarray(state_particles_mesh),
+                cupy.asarray(observation_means),
+                cupy.asarray(observation),
+                cupy.asarray(model.observation_noise_std),
+                cupy.asarray(padded_indices),
+                cupy.asarray(padded_weights),
+                self.inflation_factor,
+            )
+        )
+        post_state_particles = post_state_particles_mesh.reshape((num_particle, -1))
+        return (
+            post_state_particles,
+            post_state_particles.mean(0),
+            post_state_particles.std(0),
+        )
+
+    def _assimilation_update(
+        self,
+        model: AbstractDiagonalGaussianObservationModel,
+        rng: Generator,
+        state_particles: np.ndarray,
+        observation: np.ndarray,
+        time_index: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self.local_update_backend == "loop":
+            return super()._assimilation_update(
+                model, rng, state_particles, observation, time_index
+            )
+        elif self.local_update_backend == "batched":
+            return self._batched_assimilation_update(
+                model, state_particles, observation, time_index
+            )
+        elif self.local_update_backend == "gpu":
+            return self._gpu_assimilation_update(
+                model, state_particles, observation, time_index
+            )
+        num_particle = state_particles.shape[0]
+        state_particles_mesh = np.ascontiguousarray(
+            state_particles.reshape((num_particle, -1, model.mesh_size))
+        )
+        observation_means = model.observation_mean(state_particles, time_index)
+        (
+            node_observation_indices,
+            node_observation_weights,
+            node_observation_offsets,
+        ) = self._flat_observation_indices_and_weights(model)
+        post_state_particles_mesh = np.full(state_particles_mesh.shape, np.nan)
+        # Fetch the update kernel specialized to the current ensemble size, which
+        # is compiled on first use and then shared by all filters with matching
+        # ensemble size in the process
+        _letkf_local_assimilation_updates = _make_letkf_local_assimilation_updates(
+            num_particle
+        )
+        _letkf_local_assimilation_updates(
+            state_particles_mesh,
+            observation_means,
+            observation,
+            model.observation_noise_std,
+            node_observation_indices,
+            node_observation_weights,
+            node_observation_offsets,
+            float(self.inflation_factor),
+            post_state_particles_mesh,
+        )
+        post_state_particles = post_state_particles_mesh.reshape((num_particle, -1))
+        return (
+            post_state_particles,
+            post_state_particles.mean(0),
+            post_state_particles.std(0),
+        )
+
     def _local_assimilation_update(
         self,
         node_state_particles: np.ndarray,
@@ -317,7 +828,6 @@ class LocalEnsembleTransformKalmanFilter(AbstractLocalEnsembleFilter):
         local_observation_weights: np.ndarray,
     ) -> np.ndarray:
         num_particle = node_state_particles.shape[0]
-        dim_observation_local = local_observation.shape[0]
         # Compute local state ensemble mean vector and deviations matrix
         node_state_mean = node_state_particles.mean(0)
         node_state_deviations = node_state_particles - node_state_mean
@@ -332,19 +842,22 @@ class LocalEnsembleTransformKalmanFilter(AbstractLocalEnsembleFilter):
         effective_inv_observation_variance = (
             local_observation_weights / local_observation_noise_std ** 2
         )
-        transform_matrix_eigenvectors, non_zero_singular_values, _ = nla.svd(
+        # Compute eigendecomposition of num_particle x num_particle Gram matrix of
+        # whitened observation deviations, from which both the transform matrix
+        # square-root and the Kalman gain applied to the observation error can be
+        # derived by scalar operations on the eigenvalues, avoiding a second
+        # factorization. Rank-deficiency when dim_observation_local < num_particle
+        # is automatically handled by the corresponding eigenvalues being zero.
+        whitened_observation_deviations = (
             local_observation_deviations
             * effective_inv_observation_variance ** 0.5
-            / (num_particle - 1) ** 0.5,
-        )
-        squared_transform_matrix_eigenvalues = 1 / (1 + non_zero_singular_values ** 2)
-        if dim_observation_local < num_particle:
-            squared_transform_matrix_eigenvalues = np.concatenate(
-                [
-                    squared_transform_matrix_eigenvalues,
-                    np.ones(num_particle - dim_observation_local),
-                ]
-            )
+            / (num_particle - 1) ** 0.5
+        )
+        gram_eigenvalues, transform_matrix_eigenvectors = nla.eigh(
+            whitened_observation_deviations @ whitened_observation_deviations.T
+        )
+        np.maximum(gram_eigenvalues, 0, out=gram_eigenvalues)
+        squared_transform_matrix_eigenvalues = 1 / (1 + gram_eigenvalues)
         transform_matrix = (
             transform_matrix_eigenvectors * squared_transform_matrix_eigenvalues ** 0.5
         ) @ transform_matrix_eigenvectors.T
@@ -4,7 +4,6 @@ import abc
 from typing import Optional, Union, Sequence
 from numbers import Number
 import numpy as np
-import numpy.linalg as nla
 import scipy.linalg as sla
 from numpy.random import Generator
 from dapy.utils.progressbar import ProgressBar
@@ -848,6 +847,16 @@ class AbstractGaussianObservationModel(AbstractAdditiveObservationNoiseModel):
                 will be assumed to be specified directly by the array.
         """
         self._observation_noise_covar = observation_noise_covar
+        if (
+            isinstance(observation_noise_covar, np.ndarray)
+            and observation_noise_covar.ndim == 2
+        ):
+            # Precompute lower-triangular Cholesky factor of dense observation
+            # noise covariance once here so that the factorization is shared by
+            # the solves in the postmultiply helper methods across all time steps
+            self._chol_observation_noise_covar = sla.cholesky(
+                observation_noise_covar, lower=True
+            )
         super().__init__(dim_state=dim_state, dim_observation=dim_observation, **kwargs)
 
     @property
@@ -917,12 +926,14 @@ class AbstractGaussianObservationModel(AbstractAdditiveObservationNoiseModel):
             isinstance(self._observation_noise_covar, np.ndarray)
             and self._observation_noise_covar.ndim == 1
         ):
-            return matrix_or_vector / self._observation_noise_covar
-        else:
-            if not hasattr(self, "_chol_observation_noise_covar"):
-                self._chol_observation_noise_covar = nla.cholesky(
-                    self._observation_noise_covar
+            # Cache reciprocal of scalar / diagonal covariance so repeated calls
+            # only require a broadcast multiply rather than a divide
+            if not hasattr(self, "_inv_observation_noise_covar_diagonal"):
+                self._inv_observation_noise_covar_diagonal = (
+                    1 / self._observation_noise_covar
                 )
+            return matrix_or_vector * self._inv_observation_noise_covar_diagonal
+        else:
             return sla.cho_solve(
                 (self._chol_observation_noise_covar, True), matrix_or_vector
             )
@@ -942,12 +953,15 @@ class AbstractGaussianObservationModel(AbstractAdditiveObservationNoiseModel):
             isinstance(self._observation_noise_covar, np.ndarray)
             and self._observation_noise_covar.ndim == 1
         ):
-            return matrix_or_vector / self._observation_noise_covar ** 0.5
-        else:
-            if not hasattr(self, "_chol_observation_noise_covar"):
-                self._chol_observation_noise_covar = sla.cholesky(
-                    self._observation_noise_covar
+            # Cache reciprocal square-root of scalar / diagonal covariance so
+            # repeated calls only require a broadcast multiply rather than
+            # recomputing the square root and dividing
+            if not hasattr(self, "_inv_sqrt_observation_noise_covar_diagonal"):
+                self._inv_sqrt_observation_noise_covar_diagonal = (
+                    1 / self._observation_noise_covar ** 0.5
                 )
+            return matrix_or_vector * self._inv_sqrt_observation_noise_covar_diagonal
+        else:
             return sla.solve_triangular(
                 self._chol_observation_noise_covar, matrix_or_vector.T, lower=True
             ).T